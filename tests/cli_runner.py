@@ -0,0 +1,75 @@
+"""In-process CLI runner shared by the unit and integration tests."""
+
+import contextlib
+import io
+import os
+import subprocess
+import sys
+from unittest import mock
+
+# The CLI script (no .py extension) is loaded by tests/conftest.py
+import claude_history as _claude_cli
+
+
+@contextlib.contextmanager
+def _working_directory(path):
+    old = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(old)
+
+
+def _capture_stream():
+    """Return a text stream over a byte buffer.
+
+    Unlike StringIO it supports reconfigure() and .buffer, which main()
+    uses to switch the console streams to UTF-8 on Windows.
+    """
+    return io.TextIOWrapper(io.BytesIO(), encoding="utf-8", newline="")
+
+
+def _captured_text(stream) -> str:
+    stream.flush()
+    return stream.buffer.getvalue().decode("utf-8", errors="replace")
+
+
+class CliRunner:
+    """Run the CLI's main() in this interpreter.
+
+    Each invoke patches sys.argv, replaces os.environ with env, uses a fresh
+    Windows home cache and captures stdout/stderr. Errors escaping main()
+    become exit code 1, as in the script's __main__ block.
+    """
+
+    def __init__(self, cli=_claude_cli):
+        self.cli = cli
+
+    def invoke(self, args, env=None, cwd=None):
+        """Run one command and return a CompletedProcess with text output."""
+        argv = [self.cli.__file__, *args]
+        out, err = _capture_stream(), _capture_stream()
+        returncode = 0
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(mock.patch.dict(os.environ, env or os.environ.copy(), clear=True))
+            stack.enter_context(mock.patch.object(sys, "argv", argv))
+            stack.enter_context(self.cli.windows_home_cache_context())
+            if cwd:
+                stack.enter_context(_working_directory(cwd))
+            stack.enter_context(contextlib.redirect_stdout(out))
+            stack.enter_context(contextlib.redirect_stderr(err))
+            try:
+                self.cli.main()
+            except SystemExit as e:
+                if e.code is None or isinstance(e.code, int):
+                    returncode = e.code or 0
+                else:
+                    err.write(f"{e.code}\n")
+                    returncode = 1
+            except Exception as e:
+                err.write(f"\nError: {e}\n")
+                returncode = 1
+        return subprocess.CompletedProcess(
+            argv, returncode, _captured_text(out), _captured_text(err)
+        )
@@ -1,28 +1,119 @@
 """Test-wide fixtures and hooks."""
 
+import functools
+import importlib.machinery
+import importlib.util
 import os
 import sys
+from pathlib import Path
 
-# Keep a dedicated stdout handle that tests cannot accidentally close.
-_safe_stdout = os.fdopen(
-    os.dup(sys.__stdout__.fileno()),
-    "w",
-    encoding=sys.__stdout__.encoding,
-    errors=getattr(sys.__stdout__, "errors", "strict"),
-    buffering=1,
-)
+# Module name the CLI script is registered under; test modules use
+# ``import claude_history as ch``.
+CLI_MODULE_NAME = "claude_history"
+
+
+def _find_cli_script() -> Path:
+    """Locate the CLI script relative to this file."""
+    here = Path(__file__).resolve()
+    # Try agent-history first (new name), then claude-history (backward compat)
+    for name in ["agent-history", "claude-history"]:
+        for base in [here.parent, *here.parents]:
+            candidate = base / name
+            if candidate.exists():
+                return candidate
+    raise FileNotFoundError(
+        "Could not locate 'agent-history' or 'claude-history' script relative to tests"
+    )
+
+
+def load_cli_module():
+    """Register the extensionless CLI script as a lazily executed module.
+
+    The script has no ``.py`` suffix, so the normal import system cannot find
+    it. Registering it in ``sys.modules`` lets every test module share one
+    copy, and ``LazyLoader`` defers running the script until an attribute is
+    first accessed, so collection alone (``pytest --collect-only``) does not
+    pay for it.
+    """
+    module = sys.modules.get(CLI_MODULE_NAME)
+    if module is not None:
+        return module
+    script = str(_find_cli_script())
+    loader = importlib.machinery.SourceFileLoader(CLI_MODULE_NAME, script)
+    lazy_loader = importlib.util.LazyLoader(loader)
+    spec = importlib.util.spec_from_file_location(CLI_MODULE_NAME, script, loader=lazy_loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[CLI_MODULE_NAME] = module
+    lazy_loader.exec_module(module)
+    return module
+
+
+load_cli_module()
+
+# Keep a spare descriptor for stdout that tests cannot accidentally close.
+# Only the raw fd is held; a Python stream is wrapped around it on demand.
+_SAVED_STDOUT_FD = os.dup(sys.__stdout__.fileno())
+
+
+@functools.lru_cache(maxsize=None)
+def _get_safe_stdout():
+    """Return a line-buffered stream over the saved stdout descriptor."""
+    return os.fdopen(
+        _SAVED_STDOUT_FD,
+        "w",
+        encoding=sys.__stdout__.encoding,
+        errors=getattr(sys.__stdout__, "errors", "strict"),
+        buffering=1,
+        closefd=False,
+    )
+
+
+def _stdout_is_healthy() -> bool:
+    """Return True unless sys.stdout is closed or a replacement without a descriptor."""
+    stream = sys.stdout
+    if getattr(stream, "closed", True):
+        return False
+    if stream is sys.__stdout__:
+        return True
+    try:
+        stream.fileno()
+    except (OSError, ValueError, AttributeError):
+        # e.g. a StringIO a test swapped in and never put back
+        return False
+    return True
 
 
 def _restore_stdout():
-    sys.stdout = _safe_stdout
+    if _stdout_is_healthy():
+        return
+    try:
+        os.fstat(1)
+    except OSError:
+        # fd 1 itself was closed; point it back at the original stdout
+        os.dup2(_SAVED_STDOUT_FD, 1)
+    sys.stdout = _get_safe_stdout()
+
+
+def pytest_runtestloop(session):
+    """Execute the lazily loaded CLI once before the first test runs.
+
+    Collection stays cheap, but each process (including every xdist worker)
+    pays the script's one-off execution here rather than inside whichever
+    test happens to run first, so that test's duration isn't inflated.
+    """
+    if session.config.option.collectonly or not session.items:
+        return
+    getattr(load_cli_module(), "main", None)
 
 
 def pytest_sessionfinish(session, exitstatus):
     """Restore stdout if a test closed or replaced it.
 
     Some tests or third-party tools may leave ``sys.stdout`` pointing to a
-    closed stream, which causes pytest's final flush to raise an OSError on
-    Windows. Resetting to the dedicated safe stream keeps session teardown stable.
+    closed stream, or to a replacement without a file descriptor, which causes
+    pytest's final flush to raise an OSError on Windows. Resetting to the
+    dedicated safe stream keeps session teardown stable; a healthy stdout is
+    left alone.
     """
     _restore_stdout()
 
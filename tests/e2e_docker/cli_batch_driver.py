@@ -0,0 +1,59 @@
+"""Run several agent-history invocations inside one interpreter.
+
+Used by helpers.run_cli_batch. Usage:
+
+    python cli_batch_driver.py /path/to/agent-history < commands.jsonl
+
+Each stdin line is a JSON argv list. For each one, a JSON object with
+returncode, stdout and stderr is written to stdout, in the same order, so
+a sequence of CLI calls pays interpreter startup and module import once.
+"""
+
+import contextlib
+import importlib.machinery
+import importlib.util
+import io
+import json
+import sys
+
+
+def _load_cli(script_path):
+    loader = importlib.machinery.SourceFileLoader("agent_history_batch", script_path)
+    spec = importlib.util.spec_from_loader(loader.name, loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
+
+
+def _run_one(cli, script_path, argv):
+    out, err = io.StringIO(), io.StringIO()
+    returncode = 0
+    sys.argv = [script_path, *argv]
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        try:
+            cli.main()
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                returncode = e.code or 0
+            else:
+                err.write(f"{e.code}\n")
+                returncode = 1
+        except Exception as e:
+            # Mirror the script's own top-level handler
+            err.write(f"\nError: {e}\n")
+            returncode = 1
+    return {"returncode": returncode, "stdout": out.getvalue(), "stderr": err.getvalue()}
+
+
+def main():
+    script_path = sys.argv[1]
+    cli = _load_cli(script_path)
+    for line in sys.stdin:
+        if line.strip():
+            result = _run_one(cli, script_path, json.loads(line))
+            sys.stdout.write(json.dumps(result) + "\n")
+            sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
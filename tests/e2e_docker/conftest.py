@@ -10,19 +10,64 @@ Environment variables (set by docker-compose):
     BETA_USERS: Comma-separated users on node-beta (default: charlie,dave)
 """
 
+import functools
+import hashlib
 import os
 import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
 import pytest
 
-from .helpers import get_env, ssh_run
+from .helpers import (
+    SSH_MUX_OPTS,
+    close_ssh_masters,
+    get_env,
+    open_ssh_master,
+    run_cli,
+    unreachable_reason,
+)
+
+# Outside Docker the SSH probe below can block for several seconds, so its
+# answer is kept on disk briefly and reused by back-to-back pytest runs.
+_PROBE_CACHE_FILE = (
+    Path(os.environ.get("XDG_CACHE_HOME") or tempfile.gettempdir())
+    / "agent-history-tests"
+    / "in-docker"
+)
+_PROBE_CACHE_TTL = 60  # seconds
+
+
+def _read_probe_cache():
+    """Return the cached probe result, or None if missing or expired."""
+    try:
+        if time.time() - _PROBE_CACHE_FILE.stat().st_mtime > _PROBE_CACHE_TTL:
+            return None
+        return _PROBE_CACHE_FILE.read_text(encoding="utf-8") == "1"
+    except OSError:
+        return None
+
+
+def _write_probe_cache(value):
+    """Persist the probe result, ignoring unwritable cache locations."""
+    try:
+        _PROBE_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        _PROBE_CACHE_FILE.write_text("1" if value else "0", encoding="utf-8")
+    except OSError:
+        pass
 
 
+@functools.lru_cache(maxsize=1)
 def _in_docker_environment():
     """Check if we're running inside the Docker test environment."""
     # Check for Docker-specific indicators
     if os.path.exists("/.dockerenv"):
         return True
+    cached = _read_probe_cache()
+    if cached is not None:
+        return cached
     # Check if we can reach node-alpha (only available in Docker network)
     try:
         result = subprocess.run(
@@ -32,6 +77,7 @@ def _in_docker_environment():
                 "BatchMode=yes",
                 "-o",
                 "ConnectTimeout=2",
+                *SSH_MUX_OPTS,
                 "alice@node-alpha",
                 "echo",
                 "ok",
@@ -40,9 +86,11 @@ def _in_docker_environment():
             timeout=5,
             check=False,
         )
-        return result.returncode == 0
+        reachable = result.returncode == 0
     except (subprocess.TimeoutExpired, FileNotFoundError):
-        return False
+        reachable = False
+    _write_probe_cache(reachable)
+    return reachable
 
 
 # Skip all tests in this directory if not in Docker environment
@@ -53,6 +101,22 @@ if not _in_docker_environment():
     )
 
 
+@pytest.fixture(scope="session", autouse=True)
+def ssh_connection_pool():
+    """Open one multiplexed SSH master per test user; close them at session end.
+
+    run_cli points the CLI at the same sockets via AGENT_HISTORY_SSH_OPTS, so
+    every remote call after the first skips key exchange and authentication.
+    """
+    cfg = get_env()
+    targets = [(user, cfg["node_alpha"]) for user in cfg["alpha_users"]]
+    targets += [(user, cfg["node_beta"]) for user in cfg["beta_users"]]
+    with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+        list(pool.map(lambda target: open_ssh_master(*target), targets))
+    yield
+    close_ssh_masters()
+
+
 @pytest.fixture(scope="session")
 def env_config():
     """Get Docker environment configuration."""
@@ -73,13 +137,13 @@ def node_beta(env_config):
 
 @pytest.fixture(scope="session")
 def alpha_users(env_config):
-    """Return list of users on node-alpha."""
+    """Return tuple of users on node-alpha."""
     return env_config["alpha_users"]
 
 
 @pytest.fixture(scope="session")
 def beta_users(env_config):
-    """Return list of users on node-beta."""
+    """Return tuple of users on node-beta."""
     return env_config["beta_users"]
 
 
@@ -108,21 +172,58 @@ def dave(node_beta):
 
 
 @pytest.fixture(scope="session")
-def verify_ssh_connectivity(alice, charlie):
-    """Verify SSH connectivity to all nodes before running tests."""
-    # Test connection to alice on node-alpha
-    result = ssh_run("alice", "node-alpha", "echo ok")
-    if result.returncode != 0:
-        pytest.skip(f"Cannot SSH to alice@node-alpha: {result.stderr}")
-
-    # Test connection to charlie on node-beta
-    result = ssh_run("charlie", "node-beta", "echo ok")
-    if result.returncode != 0:
-        pytest.skip(f"Cannot SSH to charlie@node-beta: {result.stderr}")
+def verify_ssh_connectivity(ssh_connection_pool, alice, charlie):
+    """Skip tests that need both nodes when either could not be reached.
+
+    Reachability was recorded when ssh_connection_pool opened the masters,
+    so no new connection is made here, and pytest caches a skip for the
+    rest of the session instead of re-probing for every test.
+    """
+    for target in (alice, charlie):
+        reason = unreachable_reason(target)
+        if reason is not None:
+            pytest.skip(f"Cannot SSH to {target}: {reason}")
 
     return True
 
 
+@pytest.fixture(scope="class")
+def export_scratch(tmp_path_factory):
+    """Class-wide scratch directory for export tests that discard their output.
+
+    Each test should export into its own subdirectory so it can still check
+    that the CLI created it.
+    """
+    return tmp_path_factory.mktemp("export")
+
+
+@pytest.fixture
+def unique_alias(request):
+    """Return an alias name that no other test uses.
+
+    Aliases live in the shared ~/.agent-history config, so a per-test name
+    keeps tests from clobbering each other when run in parallel (pytest -n).
+    """
+    digest = hashlib.sha1(request.node.nodeid.encode()).hexdigest()[:8]
+    name = request.node.originalname
+    if name.startswith("test_"):
+        name = name[len("test_") :]
+    return f"{name.replace('_', '-')}-{digest}"
+
+
+def _make_isolated_home(path):
+    """Create the agent directories under path and return the fixture dict."""
+    (path / ".claude" / "projects").mkdir(parents=True)
+    (path / ".codex" / "sessions").mkdir(parents=True)
+    (path / ".gemini" / "sessions").mkdir(parents=True)
+    (path / ".agent-history").mkdir(parents=True)
+
+    return {
+        "path": path,
+        "env": {"HOME": str(path)},
+    }
+
+
 @pytest.fixture
 def isolated_home(tmp_path):
     """Create an isolated home directory with required agent directories.
@@ -130,13 +231,17 @@ def isolated_home(tmp_path):
     Use this fixture when tests need to override HOME for isolation.
     Returns a dict with 'path' and 'env' ready for use with run_cli.
     """
-    # Create required directory structure
-    (tmp_path / ".claude" / "projects").mkdir(parents=True)
-    (tmp_path / ".codex" / "sessions").mkdir(parents=True)
-    (tmp_path / ".gemini" / "sessions").mkdir(parents=True)
-    (tmp_path / ".agent-history").mkdir(parents=True)
+    return _make_isolated_home(tmp_path)
 
-    return {
-        "path": tmp_path,
-        "env": {"HOME": str(tmp_path)},
-    }
+
+@pytest.fixture(scope="session")
+def synced_charlie_home(tmp_path_factory, charlie, verify_ssh_connectivity):
+    """Isolated home that has run `stats --sync -r charlie` once per session.
+
+    For read-only display tests: they share one sync instead of each
+    re-pulling the same remote data, so they must not modify it. Tests that
+    check the sync itself should keep using isolated_home.
+    """
+    home = _make_isolated_home(tmp_path_factory.mktemp("charlie_home"))
+    run_cli(["stats", "--sync", "-r", charlie], env=home["env"])
+    return home
@@ -3,26 +3,92 @@
 These are utility functions used by the e2e_docker tests.
 """
 
+import functools
+import json
 import os
 import subprocess
 import sys
 from pathlib import Path
+from types import MappingProxyType
+
+import pytest
 
 # Path to the agent-history script
 SCRIPT_PATH = Path("/app/agent-history")
+_SCRIPT_PATH_STR = str(SCRIPT_PATH)
+
+# Runs a sequence of CLI invocations in one interpreter (see run_cli_batch)
+_BATCH_DRIVER = str(Path(__file__).with_name("cli_batch_driver.py"))
 
 # Coverage configuration for subprocess tracking
 COVERAGE_RC = Path("/app/.coveragerc")
+_COVERAGE_RC_EXISTS = COVERAGE_RC.exists()
+
+# Reuse one SSH connection per user@host instead of a full handshake per call.
+# The first ssh_run to a target becomes the master; later calls multiplex over it.
+# Each xdist worker gets its own sockets so one worker's teardown cannot close
+# a master another worker is still using.
+_SSH_CONTROL_PATH = f"/tmp/ah-ssh-{os.environ.get('PYTEST_XDIST_WORKER', 'main')}-%C"
+SSH_MUX_OPTS = [
+    "-o",
+    "ControlMaster=auto",
+    "-o",
+    f"ControlPath={_SSH_CONTROL_PATH}",
+    "-o",
+    "ControlPersist=600s",
+]
+
+# Handed to the CLI through AGENT_HISTORY_SSH_OPTS so its ssh/rsync/scp calls
+# ride the same masters. No ControlPersist: a CLI run never leaves one behind.
+CLI_SSH_OPTS = f"-o ControlMaster=auto -o ControlPath={_SSH_CONTROL_PATH}"
+
+# user@host targets that may have a persistent master running
+_ssh_targets = set()
 
+# user@host -> reason, for targets whose master could not be opened.
+# run_cli skips tests aimed at these instead of waiting out SSH timeouts.
+_unreachable_targets = {}
 
+
+@functools.lru_cache(maxsize=1)
 def get_env():
-    """Get environment configuration from docker-compose."""
-    return {
-        "node_alpha": os.environ.get("NODE_ALPHA", "node-alpha"),
-        "node_beta": os.environ.get("NODE_BETA", "node-beta"),
-        "alpha_users": os.environ.get("ALPHA_USERS", "alice,bob").split(","),
-        "beta_users": os.environ.get("BETA_USERS", "charlie,dave").split(","),
-    }
+    """Get environment configuration from docker-compose.
+
+    The result is computed once and shared, so it is returned read-only.
+    """
+    return MappingProxyType(
+        {
+            "node_alpha": os.environ.get("NODE_ALPHA", "node-alpha"),
+            "node_beta": os.environ.get("NODE_BETA", "node-beta"),
+            "alpha_users": tuple(os.environ.get("ALPHA_USERS", "alice,bob").split(",")),
+            "beta_users": tuple(os.environ.get("BETA_USERS", "charlie,dave").split(",")),
+        }
+    )
+
+
+class LazyCompletedProcess(subprocess.CompletedProcess):
+    """CompletedProcess whose stdout/stderr are decoded on first access.
+
+    Most assertions only look at returncode, or format stderr into a failure
+    message, so the UTF-8 decode is skipped unless the text is actually used.
+    The raw output stays available as stdout_bytes/stderr_bytes.
+    """
+
+    def __init__(self, completed):
+        # CompletedProcess.__init__ would assign stdout/stderr and shadow the
+        # cached properties below, so only copy the plain fields.
+        self.args = completed.args
+        self.returncode = completed.returncode
+        self.stdout_bytes = completed.stdout
+        self.stderr_bytes = completed.stderr
+
+    @functools.cached_property
+    def stdout(self):
+        return self.stdout_bytes.decode("utf-8", errors="replace")
+
+    @functools.cached_property
+    def stderr(self):
+        return self.stderr_bytes.decode("utf-8", errors="replace")
 
 
 def get_coverage_env():
@@ -33,32 +99,21 @@ def get_coverage_env():
     """
     coverage_env = {}
     # Only enable coverage if explicitly requested via COVERAGE_DATA_FILE
-    if COVERAGE_RC.exists() and os.environ.get("COVERAGE_DATA_FILE"):
+    if _COVERAGE_RC_EXISTS and os.environ.get("COVERAGE_DATA_FILE"):
         coverage_env["COVERAGE_PROCESS_START"] = str(COVERAGE_RC)
     return coverage_env
 
 
-def run_cli(args, timeout=30, env=None):
-    """Run the agent-history CLI and return the result.
+def _python_cmd(run_env):
+    """Return the interpreter prefix for a CLI child process.
 
-    Args:
-        args: List of command-line arguments
-        timeout: Command timeout in seconds
-        env: Optional environment overrides
-
-    Returns:
-        subprocess.CompletedProcess with stdout, stderr, returncode
+    In coverage mode the child runs under `coverage run --parallel-mode`, so
+    each process writes its own suffixed data file for `coverage combine`.
     """
-    run_env = os.environ.copy()
-    run_env.update(get_coverage_env())
-    if env:
-        run_env.update(env)
-
-    # Use coverage run to track subprocess coverage
-    if COVERAGE_RC.exists() and run_env.get("COVERAGE_PROCESS_START"):
+    if _COVERAGE_RC_EXISTS and run_env.get("COVERAGE_PROCESS_START"):
         # Get coverage data file location from env
         coverage_data_file = run_env.get("COVERAGE_DATA_FILE", "/coverage/.coverage")
-        cmd = [
+        return [
             sys.executable,
             "-m",
             "coverage",
@@ -68,20 +123,112 @@ def run_cli(args, timeout=30, env=None):
             str(COVERAGE_RC),
             "--data-file",
             coverage_data_file,
-            str(SCRIPT_PATH),
-            *args,
         ]
-    else:
-        cmd = [sys.executable, str(SCRIPT_PATH), *args]
+    return [sys.executable]
+
+
+# Environment shared by every run_cli call; only env overrides need a copy.
+_BASE_ENV = {"AGENT_HISTORY_SSH_OPTS": CLI_SSH_OPTS, **os.environ, **get_coverage_env()}
+
+
+def _skip_if_unreachable(args):
+    """Skip the current test if args target a remote known to be unreachable."""
+    for flag, value in zip(args, args[1:]):
+        if flag in ("-r", "--remote") and value in _unreachable_targets:
+            pytest.skip(f"Cannot SSH to {value}: {_unreachable_targets[value]}")
+
+
+def run_cli(args, timeout=30, env=None):
+    """Run the agent-history CLI and return the result.
+
+    Args:
+        args: List of command-line arguments
+        timeout: Command timeout in seconds
+        env: Optional environment overrides
+
+    Returns:
+        LazyCompletedProcess with stdout, stderr, returncode
+    """
+    _skip_if_unreachable(args)
+    run_env = {**_BASE_ENV, **env} if env else _BASE_ENV
+
+    cmd = [*_python_cmd(run_env), _SCRIPT_PATH_STR, *args]
+
+    return LazyCompletedProcess(
+        subprocess.run(
+            cmd,
+            capture_output=True,
+            timeout=timeout,
+            env=run_env,
+            check=False,
+        )
+    )
+
+
+def run_cli_batch(arg_lists, timeout=60, env=None):
+    """Run several CLI invocations in a single interpreter.
+
+    Commands run in order through cli_batch_driver.py, so interpreter startup
+    and module import are paid once instead of once per call. Use this for
+    sequences whose steps do not need separate processes.
 
-    return subprocess.run(
-        cmd,
+    Args:
+        arg_lists: Sequence of command-line argument lists
+        timeout: Timeout in seconds for the whole batch
+        env: Optional environment overrides
+
+    Returns:
+        List of subprocess.CompletedProcess, one per argument list
+    """
+    for args in arg_lists:
+        _skip_if_unreachable(args)
+    run_env = {**_BASE_ENV, **env} if env else _BASE_ENV
+    payload = "".join(json.dumps(list(args)) + "\n" for args in arg_lists)
+    proc = subprocess.run(
+        [*_python_cmd(run_env), _BATCH_DRIVER, _SCRIPT_PATH_STR],
+        input=payload.encode("utf-8"),
         capture_output=True,
-        text=True,
         timeout=timeout,
         env=run_env,
         check=False,
     )
+    if proc.returncode != 0:
+        raise RuntimeError(f"CLI batch driver failed: {proc.stderr.decode(errors='replace')}")
+
+    results = []
+    for args, line in zip(arg_lists, proc.stdout.decode("utf-8").splitlines()):
+        data = json.loads(line)
+        results.append(
+            subprocess.CompletedProcess(
+                [sys.executable, _SCRIPT_PATH_STR, *args],
+                data["returncode"],
+                data["stdout"],
+                data["stderr"],
+            )
+        )
+    return results
+
+
+# Column layout of `lss` session rows (tab-separated)
+_LSS_COLUMNS = ("AGENT", "HOME", "WORKSPACE", "FILE", "MESSAGES", "DATE")
+
+
+def sessions_by_agent(lss_stdout):
+    """Group `lss` output rows by their AGENT column.
+
+    One `lss --agent auto` call lists every agent's sessions, so tests can
+    split its output instead of running lss once per agent.
+
+    Returns:
+        Dict mapping agent name to a list of (workspace, filename) tuples
+    """
+    grouped = {}
+    for line in lss_stdout.splitlines():
+        fields = line.split("\t")
+        if len(fields) != len(_LSS_COLUMNS) or fields[0] == _LSS_COLUMNS[0]:
+            continue
+        grouped.setdefault(fields[0], []).append((fields[2], fields[3]))
+    return grouped
 
 
 def ssh_run(user, host, command, timeout=30):
@@ -94,21 +241,64 @@ def ssh_run(user, host, command, timeout=30):
         timeout: SSH timeout in seconds
 
     Returns:
-        subprocess.CompletedProcess
+        LazyCompletedProcess
     """
+    target = f"{user}@{host}"
+    _ssh_targets.add(target)
     cmd = [
         "ssh",
         "-o",
         "BatchMode=yes",
         "-o",
         "ConnectTimeout=10",
-        f"{user}@{host}",
+        *SSH_MUX_OPTS,
+        target,
         command,
     ]
-    return subprocess.run(
-        cmd,
-        capture_output=True,
-        text=True,
-        timeout=timeout,
-        check=False,
+    return LazyCompletedProcess(
+        subprocess.run(
+            cmd,
+            capture_output=True,
+            timeout=timeout,
+            check=False,
+        )
     )
+
+
+def open_ssh_master(user, host):
+    """Start the persistent SSH master for user@host ahead of the first test.
+
+    A target that cannot be reached is recorded, so later run_cli calls and
+    verify_ssh_connectivity skip at once instead of timing out again.
+
+    Returns:
+        True if the target answered
+    """
+    target = f"{user}@{host}"
+    try:
+        result = ssh_run(user, host, "true", timeout=15)
+    except subprocess.TimeoutExpired:
+        _unreachable_targets[target] = "timed out"
+        return False
+    if result.returncode != 0:
+        _unreachable_targets[target] = result.stderr.strip() or f"exit {result.returncode}"
+        return False
+    return True
+
+
+def unreachable_reason(target):
+    """Return why user@host could not be reached, or None if it was fine."""
+    return _unreachable_targets.get(target)
+
+
+def close_ssh_masters():
+    """Stop the persistent SSH masters opened by ssh_run or open_ssh_master."""
+    for target in sorted(_ssh_targets):
+        subprocess.run(
+            ["ssh", *SSH_MUX_OPTS, "-O", "exit", target],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            timeout=5,
+            check=False,
+        )
+    _ssh_targets.clear()
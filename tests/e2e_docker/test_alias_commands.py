@@ -1,64 +1,65 @@
 """E2E tests for alias commands using Docker infrastructure."""
 
-from .helpers import get_env, run_cli
+import pytest
+
+from .helpers import run_cli, run_cli_batch
+
+# Every test here reads or writes the runner's own ~/.agent-history files.
+pytestmark = pytest.mark.xdist_group("local-config")
 
 
 class TestAliasLifecycle:
     """Test alias create/list/show/delete lifecycle."""
 
-    def test_alias_create_and_list(self):
+    def test_alias_create_and_list(self, unique_alias):
         """Test creating an alias and listing it."""
-        # Create alias
-        result = run_cli(["alias", "create", "test-project"])
-        assert result.returncode == 0
+        created, listed, deleted = run_cli_batch(
+            [
+                ["alias", "create", unique_alias],
+                ["alias", "list"],
+                ["alias", "delete", unique_alias],
+            ]
+        )
+        assert created.returncode == 0
 
-        # List aliases
-        result = run_cli(["alias", "list"])
-        assert result.returncode == 0
-        assert "test-project" in result.stdout
+        assert listed.returncode == 0
+        assert unique_alias in listed.stdout
 
-        # Delete alias
-        result = run_cli(["alias", "delete", "test-project"])
-        assert result.returncode == 0
+        assert deleted.returncode == 0
 
-    def test_alias_show_empty(self):
+    def test_alias_show_empty(self, unique_alias):
         """Test showing an empty alias."""
-        # Create empty alias
-        run_cli(["alias", "create", "empty-alias"])
-
-        # Show it
-        result = run_cli(["alias", "show", "empty-alias"])
-        assert result.returncode == 0
+        # Create, show, then clean up the empty alias
+        _, shown, _ = run_cli_batch(
+            [
+                ["alias", "create", unique_alias],
+                ["alias", "show", unique_alias],
+                ["alias", "delete", unique_alias],
+            ]
+        )
+        assert shown.returncode == 0
         # Should indicate it's empty or show no workspaces
 
-        # Cleanup
-        run_cli(["alias", "delete", "empty-alias"])
-
-    def test_alias_list_with_counts(self):
+    def test_alias_list_with_counts(self, unique_alias):
         """Test alias list with --counts flag."""
-        # Create alias
-        run_cli(["alias", "create", "counted-alias"])
-
-        # List with counts
-        result = run_cli(["alias", "list", "--counts"])
-        assert result.returncode == 0
-        assert "counted-alias" in result.stdout
-
-        # Cleanup
-        run_cli(["alias", "delete", "counted-alias"])
+        _, listed, _ = run_cli_batch(
+            [
+                ["alias", "create", unique_alias],
+                ["alias", "list", "--counts"],
+                ["alias", "delete", unique_alias],
+            ]
+        )
+        assert listed.returncode == 0
+        assert unique_alias in listed.stdout
 
 
 class TestAliasWithRemote:
     """Test alias commands with remote workspaces."""
 
-    def test_alias_add_from_remote(self):
+    def test_alias_add_from_remote(self, unique_alias, alice):
         """Test adding workspaces from remote to alias."""
-        env = get_env()
-        node = env["node_alpha"]
-        user = env["alpha_users"][0]
-
         # Create alias
-        result = run_cli(["alias", "create", "remote-test"])
+        result = run_cli(["alias", "create", unique_alias])
         assert result.returncode == 0
 
         # Add workspace from remote - use '*' to match any workspace
@@ -66,9 +67,9 @@ class TestAliasWithRemote:
             [
                 "alias",
                 "add",
-                "remote-test",
+                unique_alias,
                 "-r",
-                f"{user}@{node}",
+                alice,
                 "*",  # pattern to match any workspace
             ]
         )
@@ -76,54 +77,54 @@ class TestAliasWithRemote:
         assert "Traceback" not in result.stderr
 
         # Show alias
-        result = run_cli(["alias", "show", "remote-test"])
+        result = run_cli(["alias", "show", unique_alias])
         assert result.returncode == 0
 
         # Cleanup
-        run_cli(["alias", "delete", "remote-test"])
+        run_cli(["alias", "delete", unique_alias])
 
 
 class TestAliasLss:
     """Test lss command with aliases."""
 
-    def test_lss_with_alias_syntax(self):
+    def test_lss_with_alias_syntax(self, unique_alias):
         """Test lss @alias syntax."""
         # Create alias first
-        run_cli(["alias", "create", "lss-test"])
+        run_cli(["alias", "create", unique_alias])
 
         # Use @alias syntax
-        result = run_cli(["lss", "@lss-test"])
+        result = run_cli(["lss", f"@{unique_alias}"])
         # Should work even if alias is empty
         assert result.returncode in (0, 1)
         assert "Traceback" not in result.stderr
 
         # Cleanup
-        run_cli(["alias", "delete", "lss-test"])
+        run_cli(["alias", "delete", unique_alias])
 
-    def test_lss_with_alias_flag(self):
+    def test_lss_with_alias_flag(self, unique_alias):
         """Test lss --alias flag."""
-        run_cli(["alias", "create", "flag-test"])
+        run_cli(["alias", "create", unique_alias])
 
-        result = run_cli(["lss", "--alias", "flag-test"])
+        result = run_cli(["lss", "--alias", unique_alias])
         assert result.returncode in (0, 1)
         assert "Traceback" not in result.stderr
 
-        run_cli(["alias", "delete", "flag-test"])
+        run_cli(["alias", "delete", unique_alias])
 
 
 class TestAliasExport:
     """Test export command with aliases."""
 
-    def test_export_with_alias(self, tmp_path):
+    def test_export_with_alias(self, tmp_path, unique_alias):
         """Test export @alias syntax."""
-        run_cli(["alias", "create", "export-test"])
+        run_cli(["alias", "create", unique_alias])
 
-        result = run_cli(["export", "@export-test", "-o", "/tmp/alias-export"])
+        result = run_cli(["export", f"@{unique_alias}", "-o", str(tmp_path)])
         # Should work even if empty
         assert result.returncode in (0, 1)
         assert "Traceback" not in result.stderr
 
-        run_cli(["alias", "delete", "export-test"])
+        run_cli(["alias", "delete", unique_alias])
 
 
 class TestSourceManagement:
@@ -135,12 +136,9 @@ class TestSourceManagement:
         assert result.returncode == 0
         assert "Traceback" not in result.stderr
 
-    def test_lsh_add_remove_remote(self):
+    def test_lsh_add_remove_remote(self, alice):
         """Test adding and removing a remote source."""
-        env = get_env()
-        node = env["node_alpha"]
-        user = env["alpha_users"][0]
-        remote = f"{user}@{node}"
+        remote = alice
 
         # Add remote
         result = run_cli(["lsh", "add", remote])
@@ -5,11 +5,15 @@ Tests the --agent flag with Claude, Codex, and Gemini sessions on remote nodes.
 
 import pytest
 
-from .helpers import run_cli
+from .helpers import run_cli, sessions_by_agent
 
 pytestmark = pytest.mark.e2e_docker
 
+# Agents with synthetic sessions on node-beta (see generate-sessions.sh)
+AGENTS = ["claude", "codex", "gemini"]
 
+
+@pytest.mark.xdist_group("node-beta")
 class TestAgentDetection:
     """Test that different agent types are detected on remote nodes."""
 
@@ -21,80 +25,51 @@ class TestAgentDetection:
         # Should have sessions (generated fixtures include all three agents)
         assert result.stdout.strip(), "Expected sessions from all agents"
 
-    def test_claude_only(self, charlie, verify_ssh_connectivity):
-        """--agent claude shows only Claude Code sessions."""
-        result = run_cli(["lss", "*", "--agent", "claude", "-r", charlie])
-        assert result.returncode == 0, f"stderr: {result.stderr}"
-        # Should filter to Claude sessions only
-        assert result.stdout.strip(), "Expected Claude sessions but got none"
-
-    def test_codex_only(self, charlie, verify_ssh_connectivity):
-        """--agent codex shows only Codex CLI sessions."""
-        result = run_cli(["lss", "*", "--agent", "codex", "-r", charlie])
+    @pytest.mark.parametrize("agent", AGENTS)
+    def test_single_agent(self, agent, charlie, verify_ssh_connectivity):
+        """--agent <name> shows only that agent's sessions."""
+        result = run_cli(["lss", "*", "--agent", agent, "-r", charlie])
         assert result.returncode == 0, f"stderr: {result.stderr}"
-        # Should find Codex sessions (synthetic data has them)
-        assert result.stdout.strip(), "Expected Codex sessions but got none"
-
-    def test_gemini_only(self, charlie, verify_ssh_connectivity):
-        """--agent gemini shows only Gemini CLI sessions."""
-        result = run_cli(["lss", "*", "--agent", "gemini", "-r", charlie])
-        assert result.returncode == 0, f"stderr: {result.stderr}"
-        # Should find Gemini sessions (synthetic data has them)
-        assert result.stdout.strip(), "Expected Gemini sessions but got none"
+        # Synthetic data has sessions for every agent
+        assert result.stdout.strip(), f"Expected {agent} sessions but got none"
 
 
+@pytest.mark.xdist_group("node-beta")
 class TestAgentWorkspaces:
     """Test workspace listing with agent filtering."""
 
-    def test_lsw_agent_claude(self, charlie, verify_ssh_connectivity):
-        """lsw --agent claude lists Claude workspaces."""
-        result = run_cli(["lsw", "--agent", "claude", "-r", charlie])
+    @pytest.mark.parametrize(
+        ("agent", "expected"),
+        [
+            ("claude", ""),
+            # Codex workspaces come from the session cwd
+            ("codex", "myproject"),
+            # Gemini workspaces are hash-based
+            ("gemini", ""),
+        ],
+    )
+    def test_lsw_agent(self, agent, expected, charlie, verify_ssh_connectivity):
+        """lsw --agent <name> lists that agent's workspaces."""
+        result = run_cli(["lsw", "--agent", agent, "-r", charlie])
         assert result.returncode == 0, f"stderr: {result.stderr}"
-
-    def test_lsw_agent_codex(self, charlie, verify_ssh_connectivity):
-        """lsw --agent codex lists Codex workspaces."""
-        result = run_cli(["lsw", "--agent", "codex", "-r", charlie])
-        assert result.returncode == 0, f"stderr: {result.stderr}"
-        # Should find Codex workspaces (synthetic data has them)
-        assert "myproject" in result.stdout, f"Expected 'myproject' workspace, got: {result.stdout}"
-
-    def test_lsw_agent_gemini(self, charlie, verify_ssh_connectivity):
-        """lsw --agent gemini lists Gemini workspaces."""
-        result = run_cli(["lsw", "--agent", "gemini", "-r", charlie])
-        assert result.returncode == 0, f"stderr: {result.stderr}"
-        # Should find Gemini workspaces (hash-based)
-        assert result.stdout.strip(), "Expected Gemini workspaces but got none"
+        assert result.stdout.strip(), f"Expected {agent} workspaces but got none"
+        assert expected in result.stdout, f"Expected {expected!r} workspace, got: {result.stdout}"
 
 
+@pytest.mark.xdist_group("node-beta")
 class TestAgentExport:
     """Test export with agent filtering on remote nodes."""
 
-    def test_export_claude_only(self, charlie, tmp_path, verify_ssh_connectivity):
-        """Export only Claude sessions from remote."""
-        output_dir = tmp_path / "claude"
-        result = run_cli(
-            [
-                "export",
-                "--aw",
-                "--agent",
-                "claude",
-                "-r",
-                charlie,
-                "-o",
-                str(output_dir),
-            ]
-        )
-        assert result.returncode == 0, f"stderr: {result.stderr}"
-
-    def test_export_codex_only(self, charlie, tmp_path, verify_ssh_connectivity):
-        """Export only Codex sessions from remote."""
-        output_dir = tmp_path / "codex"
+    @pytest.mark.parametrize("agent", AGENTS)
+    def test_export_single_agent(self, agent, charlie, export_scratch, verify_ssh_connectivity):
+        """Export only one agent's sessions from remote."""
+        output_dir = export_scratch / agent
         result = run_cli(
             [
                 "export",
                 "--aw",
                 "--agent",
-                "codex",
+                agent,
                 "-r",
                 charlie,
                 "-o",
@@ -102,31 +77,11 @@ class TestAgentExport:
             ]
         )
         assert result.returncode == 0, f"stderr: {result.stderr}"
-        # Verify files were exported
         assert output_dir.exists(), "Output directory should be created"
 
-    def test_export_gemini_only(self, charlie, tmp_path, verify_ssh_connectivity):
-        """Export only Gemini sessions from remote."""
-        output_dir = tmp_path / "gemini"
-        result = run_cli(
-            [
-                "export",
-                "--aw",
-                "--agent",
-                "gemini",
-                "-r",
-                charlie,
-                "-o",
-                str(output_dir),
-            ]
-        )
-        assert result.returncode == 0, f"stderr: {result.stderr}"
-        # Verify output directory exists
-        assert output_dir.exists(), "Output directory should be created"
-
-    def test_export_all_agents(self, charlie, tmp_path, verify_ssh_connectivity):
+    def test_export_all_agents(self, charlie, export_scratch, verify_ssh_connectivity):
         """Export all agent types from remote."""
-        output_dir = tmp_path / "all"
+        output_dir = export_scratch / "all"
         result = run_cli(
             [
                 "export",
@@ -142,44 +97,32 @@ class TestAgentExport:
         assert result.returncode == 0, f"stderr: {result.stderr}"
 
 
+@pytest.mark.xdist_group("node-beta")
 class TestMixedAgentScenarios:
     """Test scenarios with mixed agent types."""
 
     def test_same_workspace_multiple_agents(self, charlie, verify_ssh_connectivity):
         """Workspace can have sessions from multiple agents."""
         # myproject should have Claude, Codex, and Gemini sessions
-        # (created by generate-sessions.sh)
-
-        claude_result = run_cli(["lss", "myproject", "--agent", "claude", "-r", charlie])
-        codex_result = run_cli(["lss", "myproject", "--agent", "codex", "-r", charlie])
-        # Gemini uses hash-based workspaces, so use '*' to match all
-        gemini_result = run_cli(["lss", "*", "--agent", "gemini", "-r", charlie])
-
-        # All should succeed and return sessions
-        assert claude_result.returncode == 0, f"Claude failed: {claude_result.stderr}"
-        assert codex_result.returncode == 0, f"Codex failed: {codex_result.stderr}"
-        assert gemini_result.returncode == 0, f"Gemini failed: {gemini_result.stderr}"
+        # (created by generate-sessions.sh). One auto listing covers all
+        # agents; '*' is needed because Gemini uses hash-based workspaces.
+        result = run_cli(["lss", "*", "--agent", "auto", "-r", charlie])
+        assert result.returncode == 0, f"stderr: {result.stderr}"
+        by_agent = sessions_by_agent(result.stdout)
 
-        assert claude_result.stdout.strip(), "Expected Claude sessions for myproject"
-        assert codex_result.stdout.strip(), "Expected Codex sessions for myproject"
-        assert gemini_result.stdout.strip(), "Expected Gemini sessions"
+        for agent in ("claude", "codex"):
+            workspaces = [ws for ws, _ in by_agent.get(agent, [])]
+            assert any("myproject" in ws for ws in workspaces), (
+                f"Expected {agent} sessions for myproject, got: {workspaces}"
+            )
+        assert by_agent.get("gemini"), "Expected Gemini sessions"
 
     def test_agent_count_consistency(self, charlie, verify_ssh_connectivity):
-        """All agents can be queried successfully."""
+        """Auto listing includes sessions from every agent."""
         # Use '*' to match all workspaces
-        auto_result = run_cli(["lss", "*", "--agent", "auto", "-r", charlie])
-        claude_result = run_cli(["lss", "*", "--agent", "claude", "-r", charlie])
-        codex_result = run_cli(["lss", "*", "--agent", "codex", "-r", charlie])
-        gemini_result = run_cli(["lss", "*", "--agent", "gemini", "-r", charlie])
-
-        # All should succeed
-        assert auto_result.returncode == 0, f"Auto failed: {auto_result.stderr}"
-        assert claude_result.returncode == 0, f"Claude failed: {claude_result.stderr}"
-        assert codex_result.returncode == 0, f"Codex failed: {codex_result.stderr}"
-        assert gemini_result.returncode == 0, f"Gemini failed: {gemini_result.stderr}"
-
-        # Verify we got output from each
-        assert auto_result.stdout.strip(), "Auto should return sessions"
-        assert claude_result.stdout.strip(), "Claude should return sessions"
-        assert codex_result.stdout.strip(), "Codex should return sessions"
-        assert gemini_result.stdout.strip(), "Gemini should return sessions"
+        result = run_cli(["lss", "*", "--agent", "auto", "-r", charlie])
+        assert result.returncode == 0, f"Auto failed: {result.stderr}"
+        by_agent = sessions_by_agent(result.stdout)
+
+        for agent in ("claude", "codex", "gemini"):
+            assert by_agent.get(agent), f"Auto should return {agent} sessions"
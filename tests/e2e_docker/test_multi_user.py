@@ -5,11 +5,12 @@ Tests that different users on the same host have isolated workspaces.
 
 import pytest
 
-from .helpers import run_cli
+from .helpers import run_cli, ssh_run
 
 pytestmark = pytest.mark.e2e_docker
 
 
+@pytest.mark.xdist_group("node-alpha")
 class TestUserIsolation:
     """Test that users have isolated workspace data."""
 
@@ -55,14 +56,13 @@ class TestUserIsolation:
         assert bob_export.returncode == 0, f"bob stderr: {bob_export.stderr}"
 
 
+@pytest.mark.xdist_group("node-alpha")
 class TestCrossUserAccess:
     """Test accessing another user's data (should fail without permissions)."""
 
     def test_cannot_access_other_user_home(self, node_alpha, verify_ssh_connectivity):
         """Cannot directly access another user's home directory."""
         # Try to list bob's claude directory as alice
-        from .helpers import ssh_run
-
         result = ssh_run("alice", node_alpha, "ls /home/bob/.claude/")
         # Should fail (permission denied) or be empty - either is acceptable
         # The key is that alice can't see bob's actual session data
@@ -72,19 +72,20 @@ class TestCrossUserAccess:
 class TestMultiUserOnBothNodes:
     """Test multi-user scenarios across both nodes."""
 
-    def test_four_users_four_workspaces(self, alice, bob, charlie, dave, verify_ssh_connectivity):
-        """All four test users can list their workspaces."""
-        results = {}
-        for name, remote in [
-            ("alice", alice),
-            ("bob", bob),
-            ("charlie", charlie),
-            ("dave", dave),
-        ]:
-            result = run_cli(["lsw", "-r", remote])
-            results[name] = result
-            assert result.returncode == 0, f"{name} failed: {result.stderr}"
-
-        # All users should have workspaces
-        for name, result in results.items():
-            assert result.stdout.strip() != "", f"{name} has no workspaces"
+    @pytest.mark.parametrize(
+        "user",
+        [
+            pytest.param("alice", marks=pytest.mark.xdist_group("node-alpha")),
+            pytest.param("bob", marks=pytest.mark.xdist_group("node-alpha")),
+            pytest.param("charlie", marks=pytest.mark.xdist_group("node-beta")),
+            pytest.param("dave", marks=pytest.mark.xdist_group("node-beta")),
+        ],
+    )
+    def test_four_users_four_workspaces(self, request, user, verify_ssh_connectivity):
+        """Each of the four test users can list their workspaces."""
+        remote = request.getfixturevalue(user)
+        result = run_cli(["lsw", "-r", remote])
+        assert result.returncode == 0, f"{user} failed: {result.stderr}"
+
+        # Every user should have workspaces
+        assert result.stdout.strip() != "", f"{user} has no workspaces"
@@ -63,6 +63,7 @@ class TestRemoteLsw:
             assert "myproject" in result.stdout
 
 
+@pytest.mark.xdist_group("node-beta")
 class TestRemoteLss:
     """Test lss (list sessions) with remote flag."""
 
@@ -84,6 +85,7 @@ class TestRemoteLss:
         assert result.returncode == 0, f"stderr: {result.stderr}"
 
 
+@pytest.mark.xdist_group("node-beta")
 class TestRemoteExport:
     """Test export with remote flag."""
 
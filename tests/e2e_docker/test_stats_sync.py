@@ -10,14 +10,21 @@ from .helpers import run_cli
 pytestmark = pytest.mark.e2e_docker
 
 
+@pytest.mark.xdist_group("node-beta")
 class TestStatsSyncRemote:
     """Test syncing statistics from remote nodes."""
 
-    def test_stats_sync_from_remote(self, charlie, verify_ssh_connectivity):
-        """stats --sync -r syncs data from remote node."""
-        result = run_cli(["stats", "--sync", "-r", charlie])
+    @pytest.mark.parametrize(
+        "extra_args",
+        [
+            pytest.param([], id="all-agents"),
+            pytest.param(["--agent", "claude"], id="agent-filter"),
+        ],
+    )
+    def test_stats_sync_from_remote(self, extra_args, charlie, verify_ssh_connectivity):
+        """stats --sync -r syncs data from remote node, optionally for one agent."""
+        result = run_cli(["stats", "--sync", *extra_args, "-r", charlie])
         assert result.returncode == 0, f"stderr: {result.stderr}"
-        # Should show sync progress or completion
 
     def test_stats_after_sync(self, charlie, isolated_home, verify_ssh_connectivity):
         """stats shows data after syncing from remote."""
@@ -29,40 +36,16 @@ class TestStatsSyncRemote:
         stats_result = run_cli(["stats", "--aw"], env=isolated_home["env"])
         assert stats_result.returncode == 0, f"stats stderr: {stats_result.stderr}"
 
-    def test_stats_sync_with_agent_filter(self, charlie, verify_ssh_connectivity):
-        """stats --sync with agent filter syncs only that agent's data."""
-        result = run_cli(["stats", "--sync", "--agent", "claude", "-r", charlie])
-        assert result.returncode == 0, f"stderr: {result.stderr}"
-
 
+@pytest.mark.xdist_group("node-beta")
 class TestStatsDisplayRemote:
-    """Test stats display options with remote data."""
-
-    def test_stats_tools_remote(self, charlie, isolated_home, verify_ssh_connectivity):
-        """stats --tools shows tool usage from remote."""
-        # Sync first
-        run_cli(["stats", "--sync", "-r", charlie], env=isolated_home["env"])
-
-        # Then view tool stats (--aw required when not in a workspace)
-        result = run_cli(["stats", "--tools", "--aw"], env=isolated_home["env"])
-        assert result.returncode == 0, f"stderr: {result.stderr}"
-
-    def test_stats_models_remote(self, charlie, isolated_home, verify_ssh_connectivity):
-        """stats --models shows model usage from remote."""
-        # Sync first
-        run_cli(["stats", "--sync", "-r", charlie], env=isolated_home["env"])
-
-        # Then view model stats (--aw required when not in a workspace)
-        result = run_cli(["stats", "--models", "--aw"], env=isolated_home["env"])
-        assert result.returncode == 0, f"stderr: {result.stderr}"
-
-    def test_stats_by_workspace_remote(self, charlie, isolated_home, verify_ssh_connectivity):
-        """stats --by-workspace shows per-workspace stats from remote."""
-        # Sync first
-        run_cli(["stats", "--sync", "-r", charlie], env=isolated_home["env"])
+    """Test stats display options with remote data (synced once per session)."""
 
-        # Then view workspace stats (--aw required when not in a workspace)
-        result = run_cli(["stats", "--by-workspace", "--aw"], env=isolated_home["env"])
+    @pytest.mark.parametrize("view", ["--tools", "--models", "--by-workspace"])
+    def test_stats_view_remote(self, view, synced_charlie_home):
+        """stats --tools/--models/--by-workspace work on synced remote data."""
+        # --aw required when not in a workspace
+        result = run_cli(["stats", view, "--aw"], env=synced_charlie_home["env"])
         assert result.returncode == 0, f"stderr: {result.stderr}"
 
 
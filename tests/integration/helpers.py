@@ -0,0 +1,98 @@
+"""Shared helpers for integration tests.
+
+run_cli drives the CLI in-process through CliRunner by default. Set
+CLAUDE_HISTORY_E2E_SUBPROCESS=1 to run every call in a fresh interpreter
+instead, e.g. when checking behaviour that depends on process boundaries.
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from tests.cli_runner import CliRunner
+
+_USE_SUBPROCESS = os.environ.get("CLAUDE_HISTORY_E2E_SUBPROCESS") == "1"
+
+# Use agent-history (new name), fall back to claude-history for backward compat
+_SCRIPT_PATH = Path.cwd() / "agent-history"
+if not _SCRIPT_PATH.exists():
+    _SCRIPT_PATH = Path.cwd() / "claude-history"
+_CLI_CMD = (sys.executable, str(_SCRIPT_PATH))
+
+# Parent variables passed through to the CLI; test envs start from these
+# instead of a full copy of os.environ.
+_BASE_ENV_KEYS = (
+    "PATH",
+    "HOME",
+    "USERPROFILE",
+    "SYSTEMROOT",
+    "PYTHONPATH",
+    "PYTHONUTF8",
+    "LANG",
+    "TMPDIR",
+    "TEMP",
+    "TMP",
+)
+_BASE_ENV = {key: os.environ[key] for key in _BASE_ENV_KEYS if key in os.environ}
+
+
+def make_env(**overrides) -> dict:
+    """Return a minimal environment for the CLI with overrides applied."""
+    return {**_BASE_ENV, **overrides}
+
+
+def find_markdown(root) -> list:
+    """Return .md files directly under root or one directory below it.
+
+    Exports write into root (--flat) or root/<workspace>/, so this covers
+    the layout with os.scandir instead of a recursive rglob walk.
+    """
+    found = []
+    with os.scandir(root) as entries:
+        subdirs = []
+        for entry in entries:
+            if entry.name.endswith(".md") and entry.is_file():
+                found.append(Path(entry.path))
+            elif entry.is_dir():
+                subdirs.append(entry.path)
+    for subdir in subdirs:
+        with os.scandir(subdir) as entries:
+            found.extend(
+                Path(entry.path)
+                for entry in entries
+                if entry.name.endswith(".md") and entry.is_file()
+            )
+    return found
+
+
+def assert_contains_all(path, needles) -> None:
+    """Assert that the file at path contains every needle.
+
+    The file is read once and searched as undecoded bytes; all missing
+    needles are reported together with the start of the file.
+    """
+    data = Path(path).read_bytes()
+    missing = [needle for needle in needles if needle.encode("utf-8") not in data]
+    assert not missing, f"{path} is missing {missing}:\n{data[:1000].decode('utf-8', 'replace')}"
+
+
+_RUNNER = CliRunner()
+
+
+def run_cli(args, env=None, timeout=25, cwd=None):
+    """Run agent-history with args and return a CompletedProcess.
+
+    timeout only applies in subprocess mode.
+    """
+    if not _USE_SUBPROCESS:
+        return _RUNNER.invoke(args, env=env, cwd=cwd)
+    return subprocess.run(
+        [*_CLI_CMD, *args],
+        capture_output=True,
+        text=True,
+        env=env or os.environ.copy(),
+        cwd=str(cwd) if cwd else None,
+        timeout=timeout,
+        check=False,
+    )
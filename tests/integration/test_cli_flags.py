@@ -1,37 +1,59 @@
 import json
-import subprocess
-import sys
 from pathlib import Path
 
+import pytest
+
+from tests.cli_runner import CliRunner
+
+_SESSION_MESSAGES = (
+    {
+        "type": "user",
+        "message": {"role": "user", "content": "Hello"},
+        "timestamp": "2025-01-01T00:00:00Z",
+        "uuid": "u1",
+        "sessionId": "s1",
+    },
+    {
+        "type": "assistant",
+        "message": {"role": "assistant", "content": [{"type": "text", "text": "Hi"}]},
+        "timestamp": "2025-01-01T00:01:00Z",
+        "uuid": "a1",
+        "sessionId": "s1",
+    },
+)
+
+
+# Encoded once; each fixture session is a single write
+_SESSION_JSONL = "".join(json.dumps(message) + "\n" for message in _SESSION_MESSAGES)
+
 
 def _write_session(path: Path) -> None:
-    messages = [
-        {
-            "type": "user",
-            "message": {"role": "user", "content": "Hello"},
-            "timestamp": "2025-01-01T00:00:00Z",
-            "uuid": "u1",
-            "sessionId": "s1",
-        },
-        {
-            "type": "assistant",
-            "message": {"role": "assistant", "content": [{"type": "text", "text": "Hi"}]},
-            "timestamp": "2025-01-01T00:01:00Z",
-            "uuid": "a1",
-            "sessionId": "s1",
-        },
-    ]
-    path.write_text("\n".join(json.dumps(m) for m in messages), encoding="utf-8")
-
-
-def test_cli_export_with_flags(tmp_path):
+    path.write_text(_SESSION_JSONL, encoding="utf-8")
+
+
+@pytest.fixture
+def invoke_cli(tmp_path):
+    """Return a runner that calls the CLI's main() in-process with argv.
+
+    The runner returns ``(exit_code, stdout, stderr)`` from the shared
+    CliRunner. It runs from tmp_path so startup work keyed on the working
+    directory does not look at the repository checkout.
+    """
+    runner = CliRunner()
+
+    def _invoke(*argv):
+        result = runner.invoke(argv, cwd=tmp_path)
+        return result.returncode, result.stdout, result.stderr
+
+    return _invoke
+
+
+def test_cli_export_with_flags(tmp_path, invoke_cli):
     jsonl = tmp_path / "session.jsonl"
     outdir = tmp_path / "out"
     _write_session(jsonl)
 
-    cmd = [
-        sys.executable,
-        "agent-history",
+    code, out, err = invoke_cli(
         "export",
         str(jsonl),
         "-o",
@@ -41,28 +63,17 @@ def test_cli_export_with_flags(tmp_path):
         "--split",
         "1",
         "--force",
-    ]
-    result = subprocess.run(cmd, capture_output=True, text=True, check=False)
-    assert result.returncode == 0, result.stderr
-    stdout_path = Path(result.stdout.strip()) if result.stdout.strip() else None
+    )
+    assert code == 0, err
+    stdout_path = Path(out.strip()) if out.strip() else None
     md_candidates = list(outdir.glob("*.md"))
     if stdout_path and stdout_path.exists():
         md_candidates.append(stdout_path)
-    assert (
-        md_candidates
-    ), f"no markdown output created; stdout={result.stdout} stderr={result.stderr}"
+    assert md_candidates, f"no markdown output created; stdout={out} stderr={err}"
 
 
-def test_cli_export_missing_file_returns_error(tmp_path):
+def test_cli_export_missing_file_returns_error(tmp_path, invoke_cli):
     outdir = tmp_path / "out"
-    cmd = [
-        sys.executable,
-        "agent-history",
-        "export",
-        str(tmp_path / "missing.jsonl"),
-        "-o",
-        str(outdir),
-    ]
-    result = subprocess.run(cmd, capture_output=True, text=True, check=False)
-    assert result.returncode != 0
-    assert "not found" in (result.stderr or result.stdout).lower()
+    code, out, err = invoke_cli("export", str(tmp_path / "missing.jsonl"), "-o", str(outdir))
+    assert code != 0
+    assert "not found" in (err or out).lower()
@@ -1,38 +1,17 @@
-import importlib.machinery
-import importlib.util
 import os
-import subprocess
 import sys
 from pathlib import Path
 
 import pytest
 
+# The CLI script (no .py extension) is loaded by tests/conftest.py
+import claude_history as _claude_cli
+
+from .helpers import find_markdown, make_env, run_cli
+
 pytestmark = pytest.mark.integration
 
-# Use agent-history (new name), fall back to claude-history for backward compat
-_CLI_SCRIPT = Path(__file__).resolve().parents[2] / "agent-history"
-if not _CLI_SCRIPT.exists():
-    _CLI_SCRIPT = Path(__file__).resolve().parents[2] / "claude-history"
-_CLI_LOADER = importlib.machinery.SourceFileLoader("claude_history_cli_module", str(_CLI_SCRIPT))
-_CLI_SPEC = importlib.util.spec_from_loader(_CLI_LOADER.name, _CLI_LOADER)
-_claude_cli = importlib.util.module_from_spec(_CLI_SPEC)
-_CLI_LOADER.exec_module(_claude_cli)
-
-
-def run_cli(args, env=None, timeout=20):
-    # Use agent-history (new name), fall back to claude-history for backward compat
-    script_path = Path.cwd() / "agent-history"
-    if not script_path.exists():
-        script_path = Path.cwd() / "claude-history"
-    cmd = [sys.executable, str(script_path), *args]
-    return subprocess.run(
-        cmd,
-        capture_output=True,
-        text=True,
-        env=env or os.environ.copy(),
-        timeout=timeout,
-        check=False,
-    )
+requires_windows = pytest.mark.skipif(sys.platform != "win32", reason="Requires Windows")
 
 
 def make_workspace(root: Path, encoded_name: str, files: int = 1):
@@ -44,42 +23,44 @@ def make_workspace(root: Path, encoded_name: str, files: int = 1):
 
 
 def isolated_agent_env(projects: Path) -> dict:
-    env = os.environ.copy()
-    env["CLAUDE_PROJECTS_DIR"] = str(projects)
-    env["CODEX_SESSIONS_DIR"] = str(projects / "_missing_codex")
-    env["GEMINI_SESSIONS_DIR"] = str(projects / "_missing_gemini")
-    env["PI_CODING_AGENT_SESSION_DIR"] = str(projects / "_missing_pi")
-    return env
+    return make_env(
+        CLAUDE_PROJECTS_DIR=str(projects),
+        CODEX_SESSIONS_DIR=str(projects / "_missing_codex"),
+        GEMINI_SESSIONS_DIR=str(projects / "_missing_gemini"),
+        PI_CODING_AGENT_SESSION_DIR=str(projects / "_missing_pi"),
+    )
 
 
-def test_e2e_local_lsh_lsw_lss(tmp_path: Path):
-    projects = tmp_path
+@pytest.fixture(scope="module")
+def local_projects_env(tmp_path_factory) -> dict:
+    """Env for a projects root with two local workspaces, shared read-only by the module."""
+    projects = tmp_path_factory.mktemp("local_projects")
     make_workspace(projects, "-home-user-e2e-one", files=2)
     make_workspace(projects, "-home-user-e2e-two", files=1)
+    return isolated_agent_env(projects)
 
-    env = isolated_agent_env(projects)
 
-    # lsh local
-    r1 = run_cli(["lsh", "--local"], env=env)
-    assert r1.returncode == 0, r1.stderr
-    assert "Local" in r1.stdout
+def test_e2e_local_lsh(local_projects_env):
+    r = run_cli(["lsh", "--local"], env=local_projects_env)
+    assert r.returncode == 0, r.stderr
+    assert "Local" in r.stdout
 
-    # lsw local
-    r2 = run_cli(["lsw", "--local"], env=env)
-    assert r2.returncode == 0, r2.stderr
-    out = r2.stdout
-    assert "/home/user/e2e-one" in out
-    assert "/home/user/e2e-two" in out
 
-    # lss local pattern
-    r3 = run_cli(["lss", "--local", "e2e-one"], env=env)
-    assert r3.returncode == 0, r3.stderr
-    assert "/home/user/e2e-one" in r3.stdout
+def test_e2e_local_lsw(local_projects_env):
+    r = run_cli(["lsw", "--local"], env=local_projects_env)
+    assert r.returncode == 0, r.stderr
+    assert "/home/user/e2e-one" in r.stdout
+    assert "/home/user/e2e-two" in r.stdout
+
+
+def test_e2e_local_lss(local_projects_env):
+    r = run_cli(["lss", "--local", "e2e-one"], env=local_projects_env)
+    assert r.returncode == 0, r.stderr
+    assert "/home/user/e2e-one" in r.stdout
 
 
+@requires_windows
 def test_e2e_windows_from_windows(tmp_path: Path):
-    if sys.platform != "win32":
-        return
     projects = tmp_path
     win_ws1 = projects / "real" / "alpha"
     win_ws2 = projects / "real" / "beta"
@@ -104,9 +85,8 @@ def test_e2e_windows_from_windows(tmp_path: Path):
         assert Path(path_str).exists(), f"Listed path is not accessible: {path_str}"
 
 
+@requires_windows
 def test_e2e_wsl_from_windows(tmp_path: Path):
-    if sys.platform != "win32":
-        return
     projects = tmp_path
     make_workspace(projects, "-home-test-distro-svc", files=1)
     # Empty workspace should still be listed
@@ -132,9 +112,8 @@ def test_e2e_wsl_from_windows(tmp_path: Path):
     assert "HOME\tWORKSPACE\tFILE\t" in r2.stdout
 
 
+@requires_windows
 def test_e2e_wsl_unc_path_without_flag(tmp_path: Path):
-    if sys.platform != "win32":
-        return
     projects = tmp_path
     make_workspace(projects, "-home-test-distro-noflag", files=1)
 
@@ -160,10 +139,18 @@ def test_e2e_export_local(tmp_path: Path):
     r = run_cli(["export", "--local", "--out", str(outdir), "user-export"], env=env, timeout=40)
     assert r.returncode == 0, r.stderr
     # Expect at least one markdown file written
-    md_files = list(outdir.rglob("*.md"))
+    md_files = find_markdown(outdir)
     assert md_files, f"No files in {outdir} after export:\n{r.stdout}\n{r.stderr}"
 
 
+_VARIANT_SESSION_ONE = (
+    b'{"type":"user","timestamp":"2025-01-01T00:00:00Z","content":[{"type":"text","text":"one"}]}\n'
+)
+_VARIANT_SESSION_TWO = (
+    b'{"type":"user","timestamp":"2025-01-02T00:00:00Z","content":[{"type":"text","text":"two"}]}\n'
+)
+
+
 def test_e2e_export_variants(tmp_path: Path):
     projects = tmp_path / "projects"
     outdir = tmp_path / "out"
@@ -174,12 +161,8 @@ def test_e2e_export_variants(tmp_path: Path):
     def make_ws(name):
         ws = projects / name
         ws.mkdir(parents=True, exist_ok=True)
-        (ws / "s1.jsonl").write_text(
-            '{"type":"user","timestamp":"2025-01-01T00:00:00Z","content":[{"type":"text","text":"one"}]}\n'
-        )
-        (ws / "s2.jsonl").write_text(
-            '{"type":"user","timestamp":"2025-01-02T00:00:00Z","content":[{"type":"text","text":"two"}]}\n'
-        )
+        (ws / "s1.jsonl").write_bytes(_VARIANT_SESSION_ONE)
+        (ws / "s2.jsonl").write_bytes(_VARIANT_SESSION_TWO)
         return ws
 
     make_ws("-home-user-flags")
@@ -206,7 +189,7 @@ def test_e2e_export_variants(tmp_path: Path):
     )
     assert r3.returncode == 0, r3.stderr
 
-    md_files = list(outdir.rglob("*.md"))
+    md_files = find_markdown(outdir)
     assert md_files, f"No markdown files found in {outdir} after variant exports"
 
 
@@ -224,7 +207,7 @@ def test_e2e_export_absolute_path_target(tmp_path: Path):
 
     r = run_cli(["export", "--local", "--out", str(outdir), target_path], env=env, timeout=40)
     assert r.returncode == 0, r.stderr
-    md_files = list(outdir.rglob("*.md"))
+    md_files = find_markdown(outdir)
     assert md_files, f"No markdown files created for absolute path target:\n{r.stdout}\n{r.stderr}"
 
 
@@ -236,17 +219,15 @@ def test_e2e_lss_absolute_path_target(tmp_path: Path):
     encoded_workspace = _claude_cli._coerce_target_to_workspace_pattern(target_path)
     make_workspace(projects, encoded_workspace, files=1)
 
-    env = os.environ.copy()
-    env["CLAUDE_PROJECTS_DIR"] = str(projects)
+    env = make_env(CLAUDE_PROJECTS_DIR=str(projects))
 
     r = run_cli(["lss", "--local", target_path], env=env)
     assert r.returncode == 0, r.stderr
     assert "session-0.jsonl" in r.stdout
 
 
+@requires_windows
 def test_e2e_all_homes_windows(tmp_path: Path):
-    if sys.platform != "win32":
-        return
     local = tmp_path / "local"
     wsl = tmp_path / "wsl"
     local.mkdir(parents=True, exist_ok=True)
@@ -284,6 +265,12 @@ def test_e2e_stats_top_ws_limit(tmp_path: Path):
 
     db_path = config_dir / "metrics.db"
     conn = _claude_cli.init_metrics_db(db_path)
+    # sync_file_to_db commits per file; skip the fsyncs and per-commit file
+    # locking, the CLI only reads the database after it is closed below.
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA journal_mode = MEMORY")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA locking_mode = EXCLUSIVE")
 
     def make_sessions(encoded_workspace: str, source: str, count: int):
         ws_dir = projects / encoded_workspace
@@ -301,9 +288,7 @@ def test_e2e_stats_top_ws_limit(tmp_path: Path):
     make_sessions("-home-user-proj-wsl-secondary", "wsl:Ubuntu", 1)
     conn.close()
 
-    env = os.environ.copy()
-    env["HOME"] = str(home_dir)
-    env["USERPROFILE"] = str(home_dir)
+    env = make_env(HOME=str(home_dir), USERPROFILE=str(home_dir))
 
     # Use --no-sync since we already populated the database directly
     result = run_cli(["stats", "--aw", "--top-ws", "1", "--no-sync"], env=env)
@@ -8,31 +8,87 @@ Tests end-to-end flows for Codex CLI session handling:
 """
 
 import json
-import os
 import sqlite3
-import subprocess
 import sys
 from pathlib import Path
 
 import pytest
 
+from .helpers import assert_contains_all, find_markdown, make_env, run_cli
+
 pytestmark = pytest.mark.integration
 
 
-def run_cli(args, env=None, timeout=25):
-    """Run agent-history CLI command."""
-    script_path = Path.cwd() / "agent-history"
-    if not script_path.exists():
-        script_path = Path.cwd() / "claude-history"
-    cmd = [sys.executable, str(script_path), *args]
-    return subprocess.run(
-        cmd,
-        capture_output=True,
-        text=True,
-        env=env or os.environ.copy(),
-        timeout=timeout,
-        check=False,
-    )
+def _codex_row_template(row: dict) -> str:
+    """Encode a JSONL row once, leaving %(name)s placeholders for per-session fields."""
+    return json.dumps(row) + "\n"
+
+
+# Fixed Codex rows, JSON-encoded once; make_codex_session only fills in
+# the date, session id and cwd.
+_CODEX_META_TPL = _codex_row_template(
+    {
+        "timestamp": "%(date)sT10:00:00.000Z",
+        "type": "session_meta",
+        "payload": {
+            "id": "%(session_id)s",
+            "cwd": "%(cwd)s",
+            "cli_version": "0.5.0",
+            "source": "cli",
+        },
+    }
+)
+_CODEX_CTX_TPL = _codex_row_template(
+    {
+        "timestamp": "%(date)sT10:00:01.000Z",
+        "type": "turn_context",
+        "payload": {"model": "o4-mini"},
+    }
+)
+# Default user/assistant exchange
+_CODEX_EXCHANGE_TPL = _codex_row_template(
+    {
+        "timestamp": "%(date)sT10:00:02.000Z",
+        "type": "response_item",
+        "payload": {
+            "type": "message",
+            "role": "user",
+            "content": [{"type": "input_text", "text": "Hello Codex"}],
+        },
+    }
+) + _codex_row_template(
+    {
+        "timestamp": "%(date)sT10:00:03.000Z",
+        "type": "response_item",
+        "payload": {
+            "type": "message",
+            "role": "assistant",
+            "content": [{"type": "output_text", "text": "Hello! How can I help?"}],
+        },
+    }
+)
+_CODEX_TOKENS_TPL = _codex_row_template(
+    {
+        "timestamp": "%(date)sT10:00:04.000Z",
+        "type": "event_msg",
+        "payload": {
+            "type": "token_count",
+            "info": {
+                "total_token_usage": {
+                    "input_tokens": 100,
+                    "cached_input_tokens": 40,
+                    "output_tokens": 15,
+                    "reasoning_output_tokens": 5,
+                    "total_tokens": 120,
+                }
+            },
+        },
+    }
+)
+# Default session (no custom messages) as one template: a single substitution
+_CODEX_DEFAULT_SESSION_TPL = (
+    _CODEX_META_TPL + _CODEX_CTX_TPL + _CODEX_EXCHANGE_TPL + _CODEX_TOKENS_TPL
+)
 
 
 def make_codex_session(
@@ -51,76 +107,20 @@ def make_codex_session(
     session_dir = base_path / ".codex" / "sessions" / year / month / day
     session_dir.mkdir(parents=True, exist_ok=True)
 
-    # Default session with realistic Codex format
-    rows = [
-        {
-            "timestamp": f"{date_str}T10:00:00.000Z",
-            "type": "session_meta",
-            "payload": {
-                "id": session_id,
-                "cwd": cwd or "/home/user/codex-project",
-                "cli_version": "0.5.0",
-                "source": "cli",
-            },
-        },
-        {
-            "timestamp": f"{date_str}T10:00:01.000Z",
-            "type": "turn_context",
-            "payload": {"model": "o4-mini"},
-        },
-    ]
-
+    # Values are JSON-escaped (without quotes) so they drop into string fields
+    fields = {
+        "date": date_str,
+        "session_id": json.dumps(session_id)[1:-1],
+        "cwd": json.dumps(cwd or "/home/user/codex-project")[1:-1],
+    }
     if messages:
-        for msg in messages:
-            rows.append(msg)
+        body = "".join(json.dumps(msg) + "\n" for msg in messages)
+        blob = (_CODEX_META_TPL + _CODEX_CTX_TPL) % fields + body + _CODEX_TOKENS_TPL % fields
     else:
-        # Default user/assistant exchange
-        rows.extend(
-            [
-                {
-                    "timestamp": f"{date_str}T10:00:02.000Z",
-                    "type": "response_item",
-                    "payload": {
-                        "type": "message",
-                        "role": "user",
-                        "content": [{"type": "input_text", "text": "Hello Codex"}],
-                    },
-                },
-                {
-                    "timestamp": f"{date_str}T10:00:03.000Z",
-                    "type": "response_item",
-                    "payload": {
-                        "type": "message",
-                        "role": "assistant",
-                        "content": [{"type": "output_text", "text": "Hello! How can I help?"}],
-                    },
-                },
-            ]
-        )
-
-    rows.append(
-        {
-            "timestamp": f"{date_str}T10:00:04.000Z",
-            "type": "event_msg",
-            "payload": {
-                "type": "token_count",
-                "info": {
-                    "total_token_usage": {
-                        "input_tokens": 100,
-                        "cached_input_tokens": 40,
-                        "output_tokens": 15,
-                        "reasoning_output_tokens": 5,
-                        "total_tokens": 120,
-                    }
-                },
-            },
-        }
-    )
+        blob = _CODEX_DEFAULT_SESSION_TPL % fields
 
     session_file = session_dir / f"rollout-{session_id}.jsonl"
-    with session_file.open("w", encoding="utf-8") as f:
-        for row in rows:
-            f.write(json.dumps(row) + "\n")
+    session_file.write_bytes(blob.encode("utf-8"))
 
     return session_file
 
@@ -157,9 +157,7 @@ def make_claude_session(
     ]
 
     session_file = workspace_dir / f"{session_id}.jsonl"
-    with session_file.open("w", encoding="utf-8") as f:
-        for row in rows:
-            f.write(json.dumps(row) + "\n")
+    session_file.write_text("".join(json.dumps(row) + "\n" for row in rows), encoding="utf-8")
 
     return session_file
 
@@ -180,13 +178,14 @@ def setup_env(tmp_path: Path):
     history_dir = tmp_path / ".agent-history"
     history_dir.mkdir(parents=True, exist_ok=True)
 
-    env = os.environ.copy()
-    # Use environment variable overrides for both agent types
-    env["CLAUDE_PROJECTS_DIR"] = str(claude_dir)
-    env["CODEX_SESSIONS_DIR"] = str(codex_dir)
+    # Use environment variable overrides for both agent types.
     # Set HOME for the metrics DB location (~/.agent-history/)
     # Note: Set HOME on all platforms since _get_config_dirs() checks HOME first
-    env["HOME"] = str(tmp_path)
+    env = make_env(
+        CLAUDE_PROJECTS_DIR=str(claude_dir),
+        CODEX_SESSIONS_DIR=str(codex_dir),
+        HOME=str(tmp_path),
+    )
     if sys.platform == "win32":
         env["USERPROFILE"] = str(tmp_path)
 
@@ -246,6 +245,20 @@ class TestCodexList:
         # Should not include Codex session identifiers
         assert "codex-only" not in result.stdout.lower()
 
+    def test_lss_agent_codex_follows_home(self, tmp_path: Path):
+        """Without CODEX_SESSIONS_DIR, Codex sessions are read from the current HOME."""
+        home_a = tmp_path / "a"
+        home_b = tmp_path / "b"
+        make_codex_session(home_a, "2025-01-15", "codex-in-home-a")
+        home_b.mkdir()
+
+        def home_env(home):
+            return make_env(HOME=str(home), USERPROFILE=str(home))
+
+        args = ["--agent", "codex", "lss", "--local", "--aw"]
+        assert "codex-in-home-a" in run_cli(args, env=home_env(home_a)).stdout
+        assert "codex-in-home-a" not in run_cli(args, env=home_env(home_b)).stdout
+
 
 # ============================================================================
 # Codex Export Tests
@@ -271,7 +284,7 @@ class TestCodexExport:
         assert result.returncode == 0, f"Export failed: {result.stderr}"
 
         # Must produce markdown output
-        md_files = list(outdir.rglob("*.md"))
+        md_files = find_markdown(outdir)
         assert len(md_files) >= 1, f"Should produce at least one markdown file, got: {md_files}"
 
         # Verify Codex markdown structure - title must indicate Codex
@@ -326,20 +339,21 @@ class TestCodexExport:
         assert result.returncode == 0, f"Export failed: {result.stderr}"
 
         # Must produce markdown
-        md_files = list(outdir.rglob("*.md"))
+        md_files = find_markdown(outdir)
         assert len(md_files) >= 1, "Should produce markdown file"
 
-        content = md_files[0].read_text()
-
-        # Verify structural elements
-        assert "# Codex Conversation" in content, "Missing Codex title"
-        # User messages use format: "## User (Message N)"
-        assert "User" in content, "Missing user message"
-        assert "Message 1" in content, "Missing message numbering"
-        # Verify tool call is rendered
-        assert "shell" in content, f"Missing tool call 'shell' in: {content}"
-        # Verify tool output is rendered
-        assert "drwxr-xr-x" in content, f"Missing tool output in: {content}"
+        assert_contains_all(
+            md_files[0],
+            [
+                "# Codex Conversation",
+                # User messages use format: "## User (Message N)"
+                "User",
+                "Message 1",
+                # Tool call and its output are rendered
+                "shell",
+                "drwxr-xr-x",
+            ],
+        )
 
     def test_export_codex_metadata_headers(self, tmp_path: Path):
         """Verify Codex export includes session metadata headers."""
@@ -356,19 +370,21 @@ class TestCodexExport:
 
         assert result.returncode == 0, f"Export failed: {result.stderr}"
 
-        md_files = list(outdir.rglob("*.md"))
+        md_files = find_markdown(outdir)
         assert len(md_files) >= 1, "Should produce markdown file"
 
-        content = md_files[0].read_text()
-
-        # Verify session metadata is present (from session_meta payload)
-        assert "## Session Metadata" in content, f"Missing metadata section: {content[:500]}"
-        assert "Session ID:" in content, f"Missing session ID: {content[:500]}"
-        assert "Working Directory:" in content, f"Missing working directory: {content[:500]}"
-        assert "CLI Version:" in content, f"Missing CLI version: {content[:500]}"
-        # Verify our fixture values
-        assert "metadata-test" in content, "Should have session ID from fixture"
-        assert "/home/user/codex-project" in content, "Should have cwd from fixture"
+        # Session metadata from the session_meta payload, with the fixture's values
+        assert_contains_all(
+            md_files[0],
+            [
+                "## Session Metadata",
+                "Session ID:",
+                "Working Directory:",
+                "CLI Version:",
+                "metadata-test",
+                "/home/user/codex-project",
+            ],
+        )
 
 
 # ============================================================================
@@ -376,23 +392,30 @@ class TestCodexExport:
 # ============================================================================
 
 
-class TestCodexStats:
-    """E2E tests for Codex stats sync and display."""
+@pytest.fixture(scope="class")
+def synced_codex_home(tmp_path_factory):
+    """Home with two Codex sessions synced once; shared read-only by a test class."""
+    home = tmp_path_factory.mktemp("codex-stats")
+    make_codex_session(home, "2025-01-15", "stats-test-1")
+    make_codex_session(home, "2025-01-16", "stats-test-2")
+    env = setup_env(home)
 
-    def test_stats_sync_includes_codex_sessions(self, tmp_path: Path):
-        """stats --sync should scan and include Codex sessions."""
-        make_codex_session(tmp_path, "2025-01-15", "stats-test-1")
-        make_codex_session(tmp_path, "2025-01-16", "stats-test-2")
+    # Use stats --sync --aw to sync all workspaces
+    result = run_cli(["stats", "--sync", "--aw"], env=env)
+    assert result.returncode == 0, f"Stats sync failed: {result.stderr}"
 
-        env = setup_env(tmp_path)
+    # Database must exist after sync
+    db_path = home / ".agent-history" / "metrics.db"
+    assert db_path.exists(), f"Database should exist at {db_path}"
+    return db_path, env
 
-        # Use stats --sync --aw to sync all workspaces
-        result = run_cli(["stats", "--sync", "--aw"], env=env)
-        assert result.returncode == 0, f"Stats sync failed: {result.stderr}"
 
-        # Database must exist after sync
-        db_path = tmp_path / ".agent-history" / "metrics.db"
-        assert db_path.exists(), f"Database should exist at {db_path}"
+class TestCodexStats:
+    """E2E tests for Codex stats sync and display."""
+
+    def test_stats_sync_includes_codex_sessions(self, synced_codex_home):
+        """stats --sync should scan and include Codex sessions."""
+        db_path, _ = synced_codex_home
 
         # Verify Codex sessions are in database
         conn = sqlite3.connect(db_path)
@@ -406,15 +429,9 @@ class TestCodexStats:
             agents["codex"] >= 2
         ), f"Should have at least 2 Codex sessions, got: {agents['codex']}"
 
-    def test_stats_display_codex_sessions(self, tmp_path: Path):
+    def test_stats_display_codex_sessions(self, synced_codex_home):
         """stats should display Codex session metrics."""
-        make_codex_session(tmp_path, "2025-01-15", "display-test")
-
-        env = setup_env(tmp_path)
-
-        # Sync first with --aw
-        sync_result = run_cli(["stats", "--sync", "--aw"], env=env)
-        assert sync_result.returncode == 0, f"Sync failed: {sync_result.stderr}"
+        _, env = synced_codex_home
 
         # Display stats for all workspaces
         result = run_cli(["stats", "--aw"], env=env)
@@ -422,18 +439,9 @@ class TestCodexStats:
         # Should show session count
         assert result.stdout.strip(), "Should have stats output"
 
-    def test_stats_codex_session_schema(self, tmp_path: Path):
+    def test_stats_codex_session_schema(self, synced_codex_home):
         """stats should have proper schema for Codex sessions."""
-        make_codex_session(tmp_path, "2025-01-15", "schema-test")
-
-        env = setup_env(tmp_path)
-
-        result = run_cli(["stats", "--sync", "--aw"], env=env)
-        assert result.returncode == 0, f"Sync failed: {result.stderr}"
-
-        # Database must exist
-        db_path = tmp_path / ".agent-history" / "metrics.db"
-        assert db_path.exists(), "Database should exist"
+        db_path, _ = synced_codex_home
 
         conn = sqlite3.connect(db_path)
 
@@ -456,17 +464,9 @@ class TestCodexStats:
         # Verify agent is set correctly
         assert all(row[0] == "codex" for row in rows), "All rows should have agent=codex"
 
-    def test_stats_codex_workspace_extraction(self, tmp_path: Path):
+    def test_stats_codex_workspace_extraction(self, synced_codex_home):
         """stats should extract workspace from Codex session_meta cwd."""
-        make_codex_session(tmp_path, "2025-01-15", "workspace-extract-test")
-
-        env = setup_env(tmp_path)
-
-        result = run_cli(["stats", "--sync", "--aw"], env=env)
-        assert result.returncode == 0, f"Sync failed: {result.stderr}"
-
-        db_path = tmp_path / ".agent-history" / "metrics.db"
-        assert db_path.exists(), "Database should exist"
+        db_path, _ = synced_codex_home
 
         conn = sqlite3.connect(db_path)
         cursor = conn.execute("SELECT workspace FROM sessions WHERE agent = 'codex'")
@@ -480,16 +480,9 @@ class TestCodexStats:
             "codex-project" in w for w in workspaces
         ), f"Should have workspace, got: {workspaces}"
 
-    def test_stats_codex_token_totals(self, tmp_path: Path):
+    def test_stats_codex_token_totals(self, synced_codex_home):
         """stats --sync should store token totals from Codex event_msg.token_count."""
-        make_codex_session(tmp_path, "2025-01-15", "token-test")
-
-        env = setup_env(tmp_path)
-        result = run_cli(["stats", "--sync", "--aw"], env=env)
-        assert result.returncode == 0, f"Sync failed: {result.stderr}"
-
-        db_path = tmp_path / ".agent-history" / "metrics.db"
-        assert db_path.exists(), "Database should exist"
+        db_path, _ = synced_codex_home
 
         conn = sqlite3.connect(db_path)
         conn.row_factory = sqlite3.Row
@@ -574,7 +567,7 @@ class TestMixedAgents:
         assert result.returncode == 0, f"Export failed: {result.stderr}"
 
         # Should have markdown files
-        md_files = list(outdir.rglob("*.md"))
+        md_files = find_markdown(outdir)
         assert len(md_files) >= 1, "Should produce markdown"
 
         # All files should be Codex format
@@ -602,7 +595,7 @@ class TestMixedAgents:
         assert result.returncode == 0, f"Export failed: {result.stderr}"
 
         # Should have markdown files
-        md_files = list(outdir.rglob("*.md"))
+        md_files = find_markdown(outdir)
         assert len(md_files) >= 1, "Should produce markdown"
 
         # All files should be Claude format
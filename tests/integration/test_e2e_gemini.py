@@ -10,29 +10,14 @@ Tests end-to-end flows for Gemini CLI session handling:
 import json
 import os
 import sqlite3
-import subprocess
 import sys
 from pathlib import Path
 
 import pytest
 
-pytestmark = pytest.mark.integration
-
+from .helpers import assert_contains_all, find_markdown, run_cli
 
-def run_cli(args, env=None, timeout=25):
-    """Run agent-history CLI command."""
-    script_path = Path.cwd() / "agent-history"
-    if not script_path.exists():
-        script_path = Path.cwd() / "claude-history"
-    cmd = [sys.executable, str(script_path), *args]
-    return subprocess.run(
-        cmd,
-        capture_output=True,
-        text=True,
-        env=env or os.environ.copy(),
-        timeout=timeout,
-        check=False,
-    )
+pytestmark = pytest.mark.integration
 
 
 def make_gemini_session(base_path: Path, project_hash: str, session_id: str, messages: list = None):
@@ -110,9 +95,7 @@ def make_claude_session(
     ]
 
     session_file = workspace_dir / f"{session_id}.jsonl"
-    with session_file.open("w", encoding="utf-8") as f:
-        for row in rows:
-            f.write(json.dumps(row) + "\n")
+    session_file.write_text("".join(json.dumps(row) + "\n" for row in rows), encoding="utf-8")
 
     return session_file
 
@@ -219,7 +202,7 @@ class TestGeminiExport:
         assert result.returncode == 0, f"Export failed: {result.stderr}"
 
         # Must produce markdown output
-        md_files = list(outdir.rglob("*.md"))
+        md_files = find_markdown(outdir)
         assert len(md_files) >= 1, f"Should produce at least one markdown file, got: {md_files}"
 
         # Verify Gemini markdown structure - title must indicate Gemini
@@ -267,13 +250,10 @@ class TestGeminiExport:
         )
         assert result.returncode == 0, f"Export failed: {result.stderr}"
 
-        md_files = list(outdir.rglob("*.md"))
+        md_files = find_markdown(outdir)
         assert len(md_files) >= 1
-        content = md_files[0].read_text()
-
-        # Verify thoughts are included
-        assert "Reasoning" in content, "Should include Reasoning section"
-        assert "Understanding Request" in content, "Should include thought subjects"
+        # Reasoning section with the thought subjects
+        assert_contains_all(md_files[0], ["Reasoning", "Understanding Request"])
 
 
 # ============================================================================
@@ -579,7 +559,7 @@ class TestGeminiWorkspaceConsistency:
         # Could be workspace dir or flat depending on mode
         all_items = list(output_dir.iterdir())
         workspace_dirs = [d for d in all_items if d.is_dir()]
-        md_files = list(output_dir.rglob("*.md"))
+        md_files = find_markdown(output_dir)
 
         # Should have exported something
         assert md_files or workspace_dirs, "Should have exported files"
@@ -1,37 +1,20 @@
 import json
 import os
-import subprocess
 import sys
 from pathlib import Path
 
 import pytest
 
-pytestmark = pytest.mark.integration
-
+from .helpers import run_cli
 
-def run_cli(args, env=None, timeout=25):
-    # Use agent-history (new name), fall back to claude-history for backward compat
-    script_path = Path.cwd() / "agent-history"
-    if not script_path.exists():
-        script_path = Path.cwd() / "claude-history"
-    cmd = [sys.executable, str(script_path), *args]
-    return subprocess.run(
-        cmd,
-        check=False,
-        capture_output=True,
-        text=True,
-        env=env or os.environ.copy(),
-        timeout=timeout,
-    )
+pytestmark = pytest.mark.integration
 
 
 def make_workspace(root: Path, encoded_name: str, jsonl_rows: list):
     ws = root / encoded_name
     ws.mkdir(parents=True, exist_ok=True)
     f = ws / "session-0.jsonl"
-    with f.open("w", encoding="utf-8") as fh:
-        for row in jsonl_rows:
-            fh.write(json.dumps(row) + "\n")
+    f.write_text("".join(json.dumps(row) + "\n" for row in jsonl_rows), encoding="utf-8")
     return ws
 
 
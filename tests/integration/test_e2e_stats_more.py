@@ -1,35 +1,20 @@
 import json
 import os
-import subprocess
 import sys
 from pathlib import Path
 
 import pytest
 
-pytestmark = pytest.mark.integration
+from .helpers import run_cli
 
+pytestmark = pytest.mark.integration
 
-def run_cli(args, env=None, timeout=25):
-    # Use agent-history (new name), fall back to claude-history for backward compat
-    script_path = Path.cwd() / "agent-history"
-    if not script_path.exists():
-        script_path = Path.cwd() / "claude-history"
-    cmd = [sys.executable, str(script_path), *args]
-    return subprocess.run(
-        cmd,
-        capture_output=True,
-        text=True,
-        env=env or os.environ.copy(),
-        timeout=timeout,
-        check=False,
-    )
+requires_windows = pytest.mark.skipif(sys.platform != "win32", reason="Requires Windows")
 
 
 def make_jsonl(path: Path, rows: list):
     path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("w", encoding="utf-8") as fh:
-        for row in rows:
-            fh.write(json.dumps(row) + "\n")
+    path.write_text("".join(json.dumps(row) + "\n" for row in rows), encoding="utf-8")
 
 
 def test_stats_models_tools_by_day(tmp_path: Path):
@@ -103,9 +88,8 @@ def test_stats_models_tools_by_day(tmp_path: Path):
     assert "#" in r_time.stdout
 
 
+@requires_windows
 def test_all_homes_sessions_windows(tmp_path: Path):
-    if sys.platform != "win32":
-        return
     # Local and WSL synthetic roots
     local = tmp_path / "local"
     wsl = tmp_path / "wsl"
@@ -1,31 +1,14 @@
 import os
-import subprocess
-import sys
 from pathlib import Path
 
 import pytest
 
+from .helpers import run_cli
+
 # Mark all tests in this module as integration
 pytestmark = pytest.mark.integration
 
 
-def run_cli(args, env=None, cwd=None, timeout=15):
-    # Use agent-history (new name), fall back to claude-history for backward compat
-    script_path = Path.cwd() / "agent-history"
-    if not script_path.exists():
-        script_path = Path.cwd() / "claude-history"
-    cmd = [sys.executable, str(script_path), *args]
-    return subprocess.run(
-        cmd,
-        capture_output=True,
-        text=True,
-        env=env or os.environ.copy(),
-        cwd=str(cwd) if cwd else None,
-        timeout=timeout,
-        check=False,
-    )
-
-
 def make_workspace(root: Path, encoded_name: str, files: int = 1):
     ws_dir = root / encoded_name
     ws_dir.mkdir(parents=True, exist_ok=True)
@@ -4,19 +4,13 @@ These tests only run when the environment is actually WSL.
 They test the low-level WSL path resolution and Windows access functions.
 """
 
-import importlib.machinery
-import importlib.util
 import os
 from pathlib import Path
 
 import pytest
 
-# Import the agent-history module (no .py extension)
-module_path = Path(__file__).parent.parent.parent / "agent-history"
-loader = importlib.machinery.SourceFileLoader("agent_history", str(module_path))
-spec = importlib.util.spec_from_loader("agent_history", loader)
-ah = importlib.util.module_from_spec(spec)
-spec.loader.exec_module(ah)
+# The agent-history script (no .py extension) is loaded by tests/conftest.py
+import claude_history as ah
 
 
 def is_wsl_environment():
@@ -19,7 +19,10 @@ CLI_PATH = Path(__file__).parent.parent.parent / "agent-history"
 
 
 def run_cli_in_temp(args: list, timeout: int = None) -> subprocess.CompletedProcess:
-    """Run the CLI with given arguments in a temp directory."""
+    """Run the CLI with given arguments in a temp directory.
+
+    Only stderr is captured; stdout is discarded since tests never inspect it.
+    """
     # Use longer timeout on Windows due to WSL scanning operations
     if timeout is None:
         timeout = 30 if sys.platform == "win32" else 5
@@ -43,7 +46,8 @@ def run_cli_in_temp(args: list, timeout: int = None) -> subprocess.CompletedProc
         cmd = [sys.executable, str(CLI_PATH), *args]
         return subprocess.run(
             cmd,
-            capture_output=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
             text=True,
             timeout=timeout,
             env=env,
@@ -247,7 +251,8 @@ class TestExportCombinations:
             timeout = 30 if sys.platform == "win32" else 10
             result = subprocess.run(
                 cmd,
-                capture_output=True,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
                 text=True,
                 timeout=timeout,
                 env=env,
@@ -286,7 +291,8 @@ class TestExportCombinations:
             timeout = 30 if sys.platform == "win32" else 10
             result = subprocess.run(
                 cmd,
-                capture_output=True,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
                 text=True,
                 timeout=timeout,
                 env=env,
@@ -393,21 +399,39 @@ class TestAliasCombinations:
             # Create
             cmd = [sys.executable, str(CLI_PATH), "alias", "create", alias_name]
             result = subprocess.run(
-                cmd, capture_output=True, text=True, timeout=5, env=env, check=False
+                cmd,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                text=True,
+                timeout=5,
+                env=env,
+                check=False,
             )
             assert "Traceback" not in result.stderr or "coverage" in result.stderr.lower()
 
             # Show
             cmd = [sys.executable, str(CLI_PATH), "alias", "show", alias_name]
             result = subprocess.run(
-                cmd, capture_output=True, text=True, timeout=5, env=env, check=False
+                cmd,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                text=True,
+                timeout=5,
+                env=env,
+                check=False,
             )
             assert "Traceback" not in result.stderr or "coverage" in result.stderr.lower()
 
             # Delete
             cmd = [sys.executable, str(CLI_PATH), "alias", "delete", alias_name]
             result = subprocess.run(
-                cmd, capture_output=True, text=True, timeout=5, env=env, check=False
+                cmd,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                text=True,
+                timeout=5,
+                env=env,
+                check=False,
             )
             assert "Traceback" not in result.stderr or "coverage" in result.stderr.lower()
 
@@ -464,7 +488,8 @@ class TestCrossCommandConsistency:
             timeout = 30 if sys.platform == "win32" else 10
             result = subprocess.run(
                 cmd,
-                capture_output=True,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
                 text=True,
                 timeout=timeout,
                 env=env,
@@ -511,7 +536,8 @@ class TestCrossCommandConsistency:
             timeout = 30 if sys.platform == "win32" else 10
             result = subprocess.run(
                 cmd,
-                capture_output=True,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
                 text=True,
                 timeout=timeout,
                 env=env,